@@ -1,11 +1,49 @@
 import os
+import re
 import json
 import sys
 import argparse
-from typing import List, Dict, Any
+import functools
+import mmap
+import multiprocessing
+from collections import Counter
+from typing import List, Dict, Any, Iterable, Optional, Tuple
 from pathlib import Path
 
-REPORT_FILE_NAME = "mitre_detection_report.json"
+try:
+    import orjson
+    JSON_DECODE_ERRORS = (json.JSONDecodeError, orjson.JSONDecodeError, UnicodeDecodeError)
+
+    def json_loads(data):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # orjson rejects the NaN/Infinity tokens that json.dump writes by default.
+            return json.loads(bytes(data))
+except ImportError:
+    orjson = None
+    json_loads = json.loads
+    JSON_DECODE_ERRORS = (json.JSONDecodeError, UnicodeDecodeError)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+REPORT_FILE_NAME = "mitre_detection_report.jsonl"
+READ_BUFFER_SIZE = 1 << 20
+READ_CHUNK_SIZE = 1 << 16
+MARKOV_PARALLEL_MIN_BYTES = 64 << 20
+SOM_NUMBA_MIN_ROWS = 100_000
+MARKOV_ANOMALY_THRESHOLD = 0.9
+MARKOV_CACHE_SIZE = 4096
+MARKOV_ACTION_SEPARATOR = re.compile(r'\s*->\s*')
+MARKOV_REPETITION_IGNORED_ACTIONS = frozenset({'auth_login', 'auth_logout', 'sys_windows_event'})
 
 MITRE_MAPPING_RULES = {
     "exfil_killchain": {
@@ -16,177 +54,379 @@ MITRE_MAPPING_RULES = {
     },
 }
 
+# Per-rule technique skeletons; matches copy one and fill in 'confidence' and 'evidence'.
+_T1078_MARKOV_LOGIN = {
+    'id': 'T1078',
+    'name': 'Valid Accounts',
+    'confidence': None,
+    'rule_matched': 'markov_suspicious_login_pattern',
+    'description': 'Suspicious login activity detected (Markov)',
+    'evidence': None
+}
+_T1041_MARKOV_REPETITION = {
+    'id': 'T1041',
+    'name': 'Exfiltration Over Command and Control Channel',
+    'confidence': None,
+    'rule_matched': 'markov_repetitive_action_pattern',
+    'description': 'Highly repetitive action pattern (Markov)',
+    'evidence': None
+}
+_TA0009_MARKOV_FALLBACK = {
+    'id': 'TA0009',
+    'name': 'Collection',
+    'confidence': 0.55,
+    'rule_matched': 'markov_max_anomaly_score_fallback',
+    'description': 'Sequence had maximum anomaly (score 0.0) but matched no specific pattern.',
+    'evidence': None
+}
+_T1070_SOM_HIGH_ATTACK = {
+    'id': 'T1070.004',
+    'name': 'Indicator Removal: File Deletion',
+    'confidence': None,
+    'rule_matched': 'som_high_attack_score',
+    'description': None,
+    'evidence': None
+}
+_T1090_SOM_ALWAYS_FLAGGED = {
+    'id': 'T1090',
+    'name': 'Proxy',
+    'confidence': 0.65,
+    'rule_matched': 'som_always_flagged_no_attack_score',
+    'description': 'User consistently flagged, but low attack score, suggesting an unusual persistent process.',
+    'evidence': None
+}
+_T1078_SOM_MIXED = {
+    'id': 'T1078',
+    'name': 'Valid Accounts',
+    'confidence': None,
+    'rule_matched': 'som_mixed_high_attack_score',
+    'description': 'Mixed normal and attack activity, hinting at legitimate credential misuse.',
+    'evidence': None
+}
+
+def _technique(template: Dict[str, Any], confidence: Optional[float], evidence: Dict[str, Any]) -> Dict[str, Any]:
+    technique = template.copy()
+    if confidence is not None:
+        technique['confidence'] = confidence
+    technique['evidence'] = evidence
+    return technique
+
 class UEBAMitreMapper:
 
     def __init__(self):
         self.rules = MITRE_MAPPING_RULES
-        pass
+        self._skip = MARKOV_REPETITION_IGNORED_ACTIONS
+        self._thresh = MARKOV_ANOMALY_THRESHOLD
+        # Markov logs repeat the same sequences heavily, so memoize per instance.
+        self._map_markov = functools.lru_cache(maxsize=MARKOV_CACHE_SIZE)(self._map_markov_impl)
 
     def map_markov_sequence(self, sequence_data: Dict[str, Any]) -> List[Dict]:
         return self._map_markov_generic(sequence_data)
 
     def _map_markov_generic(self, sequence_data: Dict[str, Any]) -> List[Dict]:
+        sequence = sequence_data.get('sequence', '') or tuple(sequence_data.get('actions', []))
+        techniques = self._map_markov(sequence, sequence_data.get('score'))
+        # Cached results are shared, hand the caller its own copies.
+        return [dict(tech, evidence=dict(tech['evidence'])) for tech in techniques]
+
+    def _map_markov_impl(self, sequence, score) -> tuple:
+        """Map a Markov sequence (an 'a -> b' string or a tuple of actions) and its score to techniques."""
         techniques = []
+
+        if isinstance(sequence, str):
+            sequence = MARKOV_ACTION_SEPARATOR.split(sequence.strip())
+
+        anomaly_score = markov_anomaly_score(score)
+
+        if anomaly_score < self._thresh:
+            return ()
         
-        sequence_str = sequence_data.get('sequence', '')
-        sequence = [a.strip() for a in sequence_str.split('->')] if sequence_str else sequence_data.get('actions', [])
-        
-        score = sequence_data.get('score')
-        anomaly_score = 0.0
-        
-        if score is not None:
-            if score == 0.0:
-                anomaly_score = 1.0
-            elif score > 0.0:
-                anomaly_score = min(1.0, score / 4.0) 
-        
-        if anomaly_score < 0.9:  
-            return techniques
-        
-        if any('login' in action.lower() for action in sequence):
-            techniques.append({
-                'id': 'T1078',  
-                'name': 'Valid Accounts',
-                'confidence': min(0.7, anomaly_score),
-                'rule_matched': 'markov_suspicious_login_pattern',
-                'description': 'Suspicious login activity detected (Markov)',
-                'evidence': {'anomaly_score': anomaly_score, 'source': 'markov'}
-            })
+        lowered = [action.lower() for action in sequence]
+        # Shared by every match here; _map_markov_generic copies it per caller.
+        evidence = {'anomaly_score': anomaly_score, 'source': 'markov'}
+
+        if any('login' in action for action in lowered):
+            techniques.append(_technique(_T1078_MARKOV_LOGIN, min(0.7, anomaly_score), evidence))
         
         if len(sequence) >= 3:
-            action_counts = {}
-            for action in sequence:
-                if action.lower() not in ['auth_login', 'auth_logout', 'sys_windows_event']: 
-                    action_counts[action.lower()] = action_counts.get(action.lower(), 0) + 1
-            
-            for action, count in action_counts.items():
-                if count >= len(sequence) * 0.6:
-                    techniques.append({
-                        'id': 'T1041', 
-                        'name': 'Exfiltration Over Command and Control Channel',
-                        'confidence': min(0.6, anomaly_score),
-                        'rule_matched': 'markov_repetitive_action_pattern',
-                        'description': 'Highly repetitive action pattern (Markov)',
-                        'evidence': {'anomaly_score': anomaly_score, 'source': 'markov'}
-                    })
-                    break
+            action_counts = Counter(action for action in lowered if action not in self._skip)
+            if action_counts and action_counts.most_common(1)[0][1] >= len(sequence) * 0.6:
+                techniques.append(_technique(_T1041_MARKOV_REPETITION, min(0.6, anomaly_score), evidence))
         
         if anomaly_score == 1.0 and not techniques:
-            techniques.append({
-                'id': 'TA0009',  
-                'name': 'Collection',
-                'confidence': 0.55, 
-                'rule_matched': 'markov_max_anomaly_score_fallback',
-                'description': 'Sequence had maximum anomaly (score 0.0) but matched no specific pattern.',
-                'evidence': {'anomaly_score': anomaly_score, 'source': 'markov'}
-            })
+            techniques.append(_technique(_TA0009_MARKOV_FALLBACK, None, evidence))
         
-        return techniques
+        return tuple(techniques)
 
     def map_som_results(self, som_data: Dict[str, Any]) -> List[Dict]:
         techniques = []
-        
+
         attack_score = som_data.get('attack_score', 0)
         benign_score = som_data.get('benign_score', 0)
         total_epochs = som_data.get('total_epochs', 1)
-        
-        anomaly_metric = attack_score / total_epochs
-        
+        flagged_epochs = som_data.get('flagged_epochs', 0)
+
+        anomaly_metric = attack_score / (total_epochs or 1)
+
         if anomaly_metric >= 0.3:
-            confidence = min(0.9, 0.5 + anomaly_metric)
-            techniques.append({
-                'id': 'T1070.004', 
-                'name': 'Indicator Removal: File Deletion',
-                'confidence': confidence,
-                'rule_matched': 'som_high_attack_score',
-                'description': f'SOM flagged high attack-like behavior ({anomaly_metric:.2f}) over time.',
-                'evidence': {'attack_score': attack_score, 'anomaly_metric': anomaly_metric, 'source': 'som'}
-            })
-
-        if som_data.get('flagged_epochs', 0) == total_epochs and attack_score == 0:
-             techniques.append({
-                'id': 'T1090',  
-                'name': 'Proxy',
-                'confidence': 0.65,
-                'rule_matched': 'som_always_flagged_no_attack_score',
-                'description': 'User consistently flagged, but low attack score, suggesting an unusual persistent process.',
-                'evidence': {'flagged_epochs': som_data['flagged_epochs'], 'source': 'som'}
-            })
+            technique = _technique(_T1070_SOM_HIGH_ATTACK, min(0.9, 0.5 + anomaly_metric),
+                                   {'attack_score': attack_score, 'anomaly_metric': anomaly_metric, 'source': 'som'})
+            technique['description'] = f'SOM flagged high attack-like behavior ({anomaly_metric:.2f}) over time.'
+            techniques.append(technique)
+
+        if flagged_epochs == total_epochs and attack_score == 0:
+            techniques.append(_technique(_T1090_SOM_ALWAYS_FLAGGED, None,
+                                         {'flagged_epochs': flagged_epochs, 'source': 'som'}))
 
         if attack_score > 0 and benign_score > 0 and attack_score > benign_score:
-            techniques.append({
-                'id': 'T1078',  
-                'name': 'Valid Accounts',
-                'confidence': min(0.8, 0.5 + anomaly_metric),
-                'rule_matched': 'som_mixed_high_attack_score',
-                'description': 'Mixed normal and attack activity, hinting at legitimate credential misuse.',
-                'evidence': {'attack_score': attack_score, 'benign_score': benign_score, 'source': 'som'}
-            })
+            techniques.append(_technique(_T1078_SOM_MIXED, min(0.8, 0.5 + anomaly_metric),
+                                         {'attack_score': attack_score, 'benign_score': benign_score, 'source': 'som'}))
 
         return techniques
 
-def calculate_risk_score(sequence_data: Dict[str, Any]) -> float:
-    score = sequence_data.get('score')
-    if score is None:
-        return 0.0
-    
+def markov_anomaly_score(score: Optional[float]) -> float:
+    """Convert a Markov sequence score to an anomaly score; 0.0 is the rarest sequence."""
     if score == 0.0:
         return 1.0
-    elif score > 0.0:
-        return min(1.0, score / 4.0)
-    return 0.0
+    return min(1.0, score / 4.0) if score and score > 0.0 else 0.0
+
+def markov_candidate_indices(risks: List[float], threshold: float = MARKOV_ANOMALY_THRESHOLD) -> List[int]:
+    """Return the positions of the risk scores that can produce a Markov detection."""
+    return [i for i, risk in enumerate(risks) if risk >= threshold]
+
+if numba is not None:
+    @numba.njit(cache=True, parallel=True)
+    def _som_rule_mask(attack, benign, epochs, flagged):
+        """Compiled equivalent of the rule conditions in map_som_results, one row per index."""
+        hits = np.zeros(attack.shape[0], dtype=np.bool_)
+        for i in numba.prange(attack.shape[0]):
+            metric = attack[i] / (epochs[i] if epochs[i] != 0.0 else 1.0)
+            hits[i] = (metric >= 0.3
+                       or (flagged[i] == epochs[i] and attack[i] == 0.0)
+                       or (attack[i] > 0.0 and benign[i] > 0.0 and attack[i] > benign[i]))
+        return hits
+else:
+    _som_rule_mask = None
+
+def som_candidate_indices(som_results: List[Dict[str, Any]]) -> List[int]:
+    """Return the positions of the SOM entries that trigger at least one rule of map_som_results.
+
+    Without NumPy, or when a field is not numeric, every position is returned
+    and map_som_results decides.
+    """
+    if np is None:
+        return list(range(len(som_results)))
+
+    columns = []
+    for field, default in (('attack_score', 0), ('benign_score', 0), ('total_epochs', 1), ('flagged_epochs', 0)):
+        column = np.array([d.get(field, default) for d in som_results])
+        if column.dtype.kind not in 'biuf':
+            # Non-numeric fields (e.g. null) follow the scalar rules in map_som_results.
+            return list(range(len(som_results)))
+        columns.append(column.astype(np.float64))
+    attack, benign, epochs, flagged = columns
 
-def load_existing_report(file_path: str) -> List[Dict]:
+    # The compiled kernel only pays off once its JIT cost is amortized over many rows.
+    if _som_rule_mask is not None and len(som_results) >= SOM_NUMBA_MIN_ROWS:
+        return np.flatnonzero(_som_rule_mask(attack, benign, epochs, flagged)).tolist()
+
+    metric = attack / np.where(epochs == 0, 1.0, epochs)
+    high_attack = metric >= 0.3
+    always_flagged = (flagged == epochs) & (attack == 0)
+    mixed = (attack > 0) & (benign > 0) & (attack > benign)
+    return np.flatnonzero(high_attack | always_flagged | mixed).tolist()
+
+def load_json_file(file_path: str) -> Any:
+    """Parse a whole JSON document, letting orjson read straight from a memory map."""
+    with open(file_path, 'rb') as f:
+        if orjson is None or os.fstat(f.fileno()).st_size == 0:
+            return json_loads(f.read())
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+            return json_loads(view)
+
+def iter_jsonl_lines(f, chunk_size: Optional[int] = None):
+    """Yield the raw lines of a binary file object without the trailing newline.
+
+    Reads fixed-size chunks and scans each byte once, so very long lines do
+    not degrade into repeated re-splitting of the same buffer.
+    """
+    chunk_size = chunk_size or READ_CHUNK_SIZE
+    tail = bytearray()
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        pos = 0
+        idx = len(tail)
+        tail.extend(chunk)
+        idx = tail.find(b'\n', idx)
+        while idx != -1:
+            yield tail[pos:idx]
+            pos = idx + 1
+            idx = tail.find(b'\n', pos)
+        del tail[:pos]
+    if tail:
+        yield tail
+
+def write_report(file_path: str, report: List[Dict]):
+    """Atomically replace file_path with the serialized report.
+
+    Output is compact unless the MITRE_REPORT_PRETTY environment variable is set.
+    """
+    pretty = bool(os.environ.get('MITRE_REPORT_PRETTY'))
+    if orjson is not None:
+        data = orjson.dumps(report, option=orjson.OPT_INDENT_2 if pretty else 0)
+    elif pretty:
+        data = json.dumps(report, indent=2).encode('utf-8')
+    else:
+        data = json.dumps(report, separators=(',', ':')).encode('utf-8')
+
+    tmp_path = file_path + '.tmp'
+    try:
+        with open(tmp_path, 'wb') as out_f:
+            out_f.write(data)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def append_report_entry(out_f, entry: Dict[str, Any]):
+    """Append one report entry as a JSON line to a binary file object."""
+    if orjson is not None:
+        out_f.write(orjson.dumps(entry, option=orjson.OPT_APPEND_NEWLINE))
+    else:
+        out_f.write(json.dumps(entry, separators=(',', ':')).encode('utf-8') + b'\n')
+
+def open_report_for_append(file_path: str):
+    """Open the JSONL report for appending, terminating a torn final line from an interrupted run first."""
+    out_f = open(file_path, 'a+b')
     try:
-        if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
-            with open(file_path, 'r') as f:
-                print(f"Loading existing report: {file_path}")
-                return json.load(f)
-        return []
-    except (FileNotFoundError, json.JSONDecodeError) as e:
-        print(f"Warning: Could not load existing report. Starting new report. Error: {e}")
-        return []
-
-def process_markov_file(file_path: str, report_list: List[Dict]):
+        if out_f.seek(0, os.SEEK_END):
+            out_f.seek(-1, os.SEEK_END)
+            if out_f.read(1) != b'\n':
+                out_f.write(b'\n')
+    except BaseException:
+        out_f.close()
+        raise
+    return out_f
+
+def jsonl_to_json(jsonl_path: str, json_path: str) -> int:
+    """Convert the append-only JSONL report into a single JSON array file; returns the entry count."""
+    report = []
+    with open(jsonl_path, 'rb', buffering=READ_BUFFER_SIZE) as f:
+        for line in iter_jsonl_lines(f):
+            if not line.strip():
+                continue
+            try:
+                report.append(json_loads(line))
+            except JSON_DECODE_ERRORS:
+                # A torn final line from an interrupted run.
+                continue
+    write_report(json_path, report)
+    return len(report)
+
+def reduce_markov_lines(lines: Iterable[bytes]) -> Tuple[int, Dict[str, Tuple[float, Dict[str, Any]]]]:
+    """Keep the riskiest sequence per user; returns (lines seen, {user_id: (risk, data)})."""
+    total_sequences = 0
+    riskiest = {}
+
+    # Hot loop: bind globals and bound methods to locals.
+    loads = json_loads
+    decode_errors = JSON_DECODE_ERRORS
+    risk_get = riskiest.get
+    anomaly_score = markov_anomaly_score
+    for line in lines:
+        total_sequences += 1
+        try:
+            sequence_data = loads(line)
+        except decode_errors:
+            continue
+
+        user_id = sequence_data.get('user_id')
+        if not user_id:
+            continue
+
+        current_risk = anomaly_score(sequence_data.get('score'))
+
+        prev = risk_get(user_id)
+        if prev is None or current_risk > prev[0]:
+            riskiest[user_id] = (current_risk, sequence_data)
+
+    return total_sequences, riskiest
+
+def _iter_range_lines(f, start: int, end: int):
+    """Yield the lines of f that begin within the byte range [start, end)."""
+    if start:
+        # The line straddling start belongs to the previous range.
+        f.seek(start - 1)
+        f.readline()
+        start = f.tell()
+    pos = start
+    for line in iter_jsonl_lines(f):
+        if pos >= end:
+            break
+        pos += len(line) + 1
+        yield line
+
+def _scan_markov_range(task: Tuple[str, int, int]):
+    file_path, start, end = task
+    with open(file_path, 'rb', buffering=READ_BUFFER_SIZE) as f:
+        return reduce_markov_lines(_iter_range_lines(f, start, end))
+
+def scan_markov_file(file_path: str,
+                     workers: Optional[int] = None) -> Tuple[int, Dict[str, Tuple[float, Dict[str, Any]]]]:
+    """Run reduce_markov_lines over a JSONL file, split by byte range across worker processes.
+
+    By default files of at least MARKOV_PARALLEL_MIN_BYTES use one worker per CPU.
+    """
+    file_size = os.path.getsize(file_path)
+    if workers is None:
+        workers = (os.cpu_count() or 1) if file_size >= MARKOV_PARALLEL_MIN_BYTES else 1
+    if workers <= 1 or file_size == 0:
+        with open(file_path, 'rb', buffering=READ_BUFFER_SIZE) as f:
+            return reduce_markov_lines(iter_jsonl_lines(f))
+
+    step = -(-file_size // workers)
+    tasks = [(file_path, start, min(start + step, file_size)) for start in range(0, file_size, step)]
+    # fork is only safe to rely on under Linux; macOS and Windows keep their default.
+    if sys.platform.startswith('linux'):
+        context = multiprocessing.get_context('fork')
+    else:
+        context = multiprocessing.get_context()
+    with context.Pool(len(tasks)) as pool:
+        results = pool.map(_scan_markov_range, tasks)
+
+    # Merge in file order so ties and user ordering match a serial scan.
+    total_sequences = 0
+    riskiest = {}
+    for count, partial in results:
+        total_sequences += count
+        for user_id, item in partial.items():
+            prev = riskiest.get(user_id)
+            if prev is None or item[0] > prev[0]:
+                riskiest[user_id] = item
+    return total_sequences, riskiest
+
+def process_markov_file(file_path: str, out_f, workers: Optional[int] = None) -> int:
     mapper = UEBAMitreMapper()
     detections_count = 0
-    total_sequences = 0
-    
-    riskiest_sequences_by_user = {}
 
     print(f"\n--- Analyzing Markov Sequences for Filtering (Source: {file_path}) ---")
     try:
-        with open(file_path, 'r') as f:
-            for line in f:
-                total_sequences += 1
-                try:
-                    sequence_data = json.loads(line.strip())
-                    user_id = sequence_data.get('user_id')
-                    
-                    if not user_id:
-                        continue
-                        
-                    current_risk = calculate_risk_score(sequence_data)
-                    
-                    if user_id not in riskiest_sequences_by_user or current_risk > riskiest_sequences_by_user[user_id]['risk_score']:
-                        riskiest_sequences_by_user[user_id] = {
-                            'risk_score': current_risk,
-                            'data': sequence_data,
-                            'original_line_num': total_sequences
-                        }
-
-                except json.JSONDecodeError:
-                    pass
-                
+        total_sequences, riskiest_sequences_by_user = scan_markov_file(file_path, workers)
     except FileNotFoundError:
         print(f"Error: Markov file not found at path: {file_path}")
-        return
+        return 0
         
     riskiest_count = len(riskiest_sequences_by_user)
     print(f"--- Processing {riskiest_count} Riskiest Sequences (1 per user) ---")
 
-    for i, (user_id, item) in enumerate(riskiest_sequences_by_user.items()):
-        sequence_data = item['data']
+    # The per-user risk equals the mapper's anomaly score, so anything below
+    # the threshold can be skipped before running the pattern rules.
+    riskiest = list(riskiest_sequences_by_user.items())
+    for i in markov_candidate_indices([risk for _, (risk, _) in riskiest]):
+        user_id, (_, sequence_data) = riskiest[i]
         sequence_id = f"Markov_User_{i+1}_TopRisk" 
         
         techniques = mapper.map_markov_sequence(sequence_data)
@@ -200,11 +440,12 @@ def process_markov_file(file_path: str, report_list: List[Dict]):
                 'source': 'markov', 
                 'detected_techniques': techniques
             }
-            report_list.append(report_entry)
+            append_report_entry(out_f, report_entry)
 
     print(f"   Markov Summary: {detections_count} new detections out of {riskiest_count} unique users processed.")
+    return detections_count
 
-def process_som_file(file_path: str, report_list: List[Dict]):
+def process_som_file(file_path: str, out_f) -> int:
     mapper = UEBAMitreMapper()
     detections_count = 0
     total_sequences = 0
@@ -212,64 +453,72 @@ def process_som_file(file_path: str, report_list: List[Dict]):
     print(f"\n--- Processing SOM Results (Source: {file_path}) ---")
 
     try:
-        with open(file_path, 'r') as f:
-            som_results = json.load(f)
-            total_sequences = len(som_results)
+        som_results = load_json_file(file_path)
+        total_sequences = len(som_results)
+        
+        for i in som_candidate_indices(som_results):
+            som_data = som_results[i]
+            techniques = mapper.map_som_results(som_data)
             
-            for i, som_data in enumerate(som_results):
-                
-                techniques = mapper.map_som_results(som_data)
-                
-                if techniques:
-                    detections_count += 1
-                    report_entry = {
-                        'sequence_id': f"SOM_User_{i+1}",
-                        'user_id': som_data.get('user_id', 'N/A'),
-                        'raw_data': som_data,
-                        'source': 'som',
-                        'detected_techniques': techniques
-                    }
-                    report_list.append(report_entry)
+            if techniques:
+                detections_count += 1
+                report_entry = {
+                    'sequence_id': f"SOM_User_{i+1}",
+                    'user_id': som_data.get('user_id', 'N/A'),
+                    'raw_data': som_data,
+                    'source': 'som',
+                    'detected_techniques': techniques
+                }
+                append_report_entry(out_f, report_entry)
             
     except FileNotFoundError:
         print(f"Error: SOM file not found at path: {file_path}")
-    except json.JSONDecodeError as e:
+    except JSON_DECODE_ERRORS as e:
         print(f"Error decoding SOM JSON: {e}")
         
     print(f"   SOM Summary: {detections_count} new detections out of {total_sequences} users/entries.")
+    return detections_count
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Dynamic MITRE ATT&CK Mapper for Markov and SOM outputs.")
     
     parser.add_argument('--markov-file', type=str, help="Path to the Markov JSONL output file.")
     parser.add_argument('--som-file', type=str, help="Path to the SOM JSON output file.")
+    parser.add_argument('--workers', type=int,
+                        help="Worker processes for Markov parsing (default: all CPUs for large files).")
+    parser.add_argument('--export-json', type=str, metavar='PATH',
+                        help=f"Convert the JSONL report ({REPORT_FILE_NAME}) into a JSON array at PATH.")
     parser.add_argument('--test', action='store_true', help="Run internal tests.")
 
     args = parser.parse_args()
     
-    if not args.markov_file and not args.som_file:
-        print("Error: Must provide at least one of --markov-file or --som-file.")
+    if not args.markov_file and not args.som_file and not args.export_json:
+        print("Error: Must provide at least one of --markov-file, --som-file or --export-json.")
         parser.print_help()
         sys.exit(1)
 
-    final_report = load_existing_report(REPORT_FILE_NAME)
-    initial_report_size = len(final_report)
+    new_entries = 0
+    if args.markov_file or args.som_file:
+        # The report is append-only JSONL: new detections never rewrite earlier runs.
+        try:
+            with open_report_for_append(REPORT_FILE_NAME) as out_f:
+                if args.markov_file:
+                    new_entries += process_markov_file(args.markov_file, out_f, args.workers)
 
-    if args.markov_file:
-        process_markov_file(args.markov_file, final_report)
+                if args.som_file:
+                    new_entries += process_som_file(args.som_file, out_f)
+        except OSError as e:
+            print(f"\nError appending to report file: {e}")
 
-    if args.som_file:
-        process_som_file(args.som_file, final_report)
-        
-    if len(final_report) > initial_report_size:
-        try:
-            with open(REPORT_FILE_NAME, 'w') as out_f:
-                json.dump(final_report, out_f, indent=4)
-            print("\n" + "="*50)
-            print(f"FINAL MERGED REPORT successfully written to {REPORT_FILE_NAME}")
-        except Exception as e:
-            print(f"\nError writing final merged report to file: {e}")
-            
+    print("\n" + "="*50)
     print("FINAL ANALYSIS SUMMARY:")
-    print(f"   Total entries in merged report: {len(final_report)}")
-    print("Analysis and Merging Complete!")
\ No newline at end of file
+    print(f"   New entries appended to {REPORT_FILE_NAME}: {new_entries}")
+
+    if args.export_json:
+        try:
+            exported = jsonl_to_json(REPORT_FILE_NAME, args.export_json)
+            print(f"   Exported {exported} entries to {args.export_json}")
+        except FileNotFoundError:
+            print(f"Error: report file not found at path: {REPORT_FILE_NAME}")
+
+    print("Analysis Complete!")
@@ -0,0 +1,224 @@
+import copy
+import io
+import json
+import math
+import random
+
+import pytest
+
+import mapper
+
+
+@pytest.fixture
+def markov_file(tmp_path):
+    rng = random.Random(7)
+    actions = ["auth_login", "file_read", "external_upload", "compress", "sys_windows_event"]
+    lines = []
+    for i in range(2000):
+        sequence = " -> ".join(rng.choice(actions) for _ in range(rng.randint(1, 6)))
+        score = rng.choice([None, 0.0, rng.uniform(0, 5), 3.9])
+        lines.append(json.dumps({"user_id": f"u{i % 150}", "sequence": sequence, "score": score}))
+    lines.insert(500, "not json")
+    lines.insert(900, "")
+    path = tmp_path / "markov.jsonl"
+    path.write_text("\n".join(lines))
+    return str(path)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64])
+@pytest.mark.parametrize(
+    "data",
+    [b"", b"\n", b"a", b"a\n", b"a\nbc", b"\n\nshort\n" + b"x" * 200 + b"\nlast line without newline"],
+)
+def test_iter_jsonl_lines_matches_split(data, chunk_size):
+    expected = data.split(b"\n")
+    if expected[-1] == b"":
+        expected.pop()
+
+    assert [bytes(line) for line in mapper.iter_jsonl_lines(io.BytesIO(data), chunk_size)] == expected
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096])
+@pytest.mark.parametrize("workers", [2, 3, 7])
+def test_scan_markov_file_matches_serial(markov_file, monkeypatch, chunk_size, workers):
+    monkeypatch.setattr(mapper, "READ_CHUNK_SIZE", chunk_size)
+    expected = mapper.scan_markov_file(markov_file, 1)
+    total_sequences, riskiest = mapper.scan_markov_file(markov_file, workers)
+
+    assert total_sequences == expected[0]
+    assert list(riskiest.items()) == list(expected[1].items())
+
+
+def test_json_loads_accepts_nan_tokens(tmp_path):
+    path = tmp_path / "som.json"
+    path.write_text('[{"user_id": "u1", "attack_score": NaN, "total_epochs": Infinity}]')
+
+    som_results = mapper.load_json_file(str(path))
+
+    assert som_results[0]["user_id"] == "u1"
+    assert math.isnan(mapper.json_loads(b'{"score": NaN}')["score"])
+
+
+@pytest.fixture(params=["numba", "numpy", "python"])
+def numpy_mode(request, monkeypatch):
+    if request.param == "numba":
+        pytest.importorskip("numba")
+        monkeypatch.setattr(mapper, "SOM_NUMBA_MIN_ROWS", 0)
+    elif request.param == "numpy":
+        pytest.importorskip("numpy")
+        monkeypatch.setattr(mapper, "_som_rule_mask", None)
+    else:
+        monkeypatch.setattr(mapper, "np", None)
+    return request.param
+
+
+def detected_som_rows(som_results, indices):
+    som_mapper = mapper.UEBAMitreMapper()
+    return [i for i in indices if som_mapper.map_som_results(som_results[i])]
+
+
+def test_som_candidate_indices_keeps_every_detection(numpy_mode):
+    rng = random.Random(3)
+    fields = ["attack_score", "benign_score", "total_epochs", "flagged_epochs"]
+    som_results = [
+        {field: rng.choice([0, 1, 2, 3, 0.5]) for field in rng.sample(fields, rng.randint(0, 4))} for _ in range(2000)
+    ]
+    expected = detected_som_rows(som_results, range(len(som_results)))
+
+    candidates = mapper.som_candidate_indices(som_results)
+
+    assert detected_som_rows(som_results, candidates) == expected
+    if numpy_mode != "python":
+        assert candidates == expected
+
+
+def test_som_candidate_indices_null_epochs(numpy_mode):
+    som_results = [{"attack_score": 2, "total_epochs": None}, {"attack_score": 0, "total_epochs": 4}]
+
+    assert detected_som_rows(som_results, mapper.som_candidate_indices(som_results)) == [0]
+
+
+def test_markov_candidate_indices():
+    assert mapper.markov_candidate_indices([0.1, 0.9, 1.0, 0.89]) == [1, 2]
+
+
+@pytest.mark.parametrize("pretty", ["", "1"])
+def test_write_report_replaces_file(tmp_path, monkeypatch, pretty):
+    monkeypatch.setenv("MITRE_REPORT_PRETTY", pretty)
+    path = tmp_path / "report.json"
+    path.write_text("stale")
+    report = [{"sequence_id": "SOM_User_1", "detected_techniques": [{"id": "T1090"}]}]
+
+    mapper.write_report(str(path), report)
+
+    assert json.loads(path.read_text()) == report
+    assert ("\n" in path.read_text()) == bool(pretty)
+    assert [p.name for p in tmp_path.iterdir()] == ["report.json"]
+
+
+def test_report_appends_jsonl_and_exports_json(tmp_path):
+    som_path = tmp_path / "som.json"
+    som_path.write_text(json.dumps([{"user_id": "u1", "attack_score": 0, "total_epochs": 2, "flagged_epochs": 2}]))
+    report_path = tmp_path / "report.jsonl"
+
+    for _ in range(2):
+        with mapper.open_report_for_append(str(report_path)) as out_f:
+            assert mapper.process_som_file(str(som_path), out_f) == 1
+    with open(report_path, "ab") as out_f:
+        out_f.write(b'{"torn": ')
+
+    assert mapper.jsonl_to_json(str(report_path), str(tmp_path / "report.json")) == 2
+
+    with mapper.open_report_for_append(str(report_path)) as out_f:
+        assert mapper.process_som_file(str(som_path), out_f) == 1
+
+    assert mapper.jsonl_to_json(str(report_path), str(tmp_path / "report.json")) == 3
+    report = json.loads((tmp_path / "report.json").read_text())
+    assert [entry["detected_techniques"][0]["id"] for entry in report] == ["T1090", "T1090", "T1090"]
+
+
+def markov_technique(technique_id, name, confidence, rule_matched, description, anomaly_score):
+    return {
+        "id": technique_id,
+        "name": name,
+        "confidence": confidence,
+        "rule_matched": rule_matched,
+        "description": description,
+        "evidence": {"anomaly_score": anomaly_score, "source": "markov"},
+    }
+
+
+MARKOV_GOLDEN_CASES = [
+    (
+        ["auth_login", "file_read"],
+        4.0,
+        [
+            markov_technique(
+                "T1078",
+                "Valid Accounts",
+                0.7,
+                "markov_suspicious_login_pattern",
+                "Suspicious login activity detected (Markov)",
+                1.0,
+            )
+        ],
+    ),
+    (
+        ["Upload", "upload", "UPLOAD", "auth_logout"],
+        3.8,
+        [
+            markov_technique(
+                "T1041",
+                "Exfiltration Over Command and Control Channel",
+                0.6,
+                "markov_repetitive_action_pattern",
+                "Highly repetitive action pattern (Markov)",
+                0.95,
+            )
+        ],
+    ),
+    (
+        ["file_read", "compress", "external_upload"],
+        0.0,
+        [
+            markov_technique(
+                "TA0009",
+                "Collection",
+                0.55,
+                "markov_max_anomaly_score_fallback",
+                "Sequence had maximum anomaly (score 0.0) but matched no specific pattern.",
+                1.0,
+            )
+        ],
+    ),
+    (["auth_login", "upload", "upload", "upload"], 3.0, []),
+]
+
+
+@pytest.mark.parametrize("as_string", [True, False])
+@pytest.mark.parametrize("actions, score, expected", MARKOV_GOLDEN_CASES)
+def test_map_markov_sequence_golden(actions, score, expected, as_string):
+    if as_string:
+        sequence_data = {"user_id": "u1", "sequence": " " + " ->  ".join(actions) + " ", "score": score}
+    else:
+        sequence_data = {"user_id": "u1", "actions": actions, "score": score}
+
+    techniques = mapper.UEBAMitreMapper().map_markov_sequence(sequence_data)
+
+    assert techniques == expected
+    assert [list(tech) for tech in techniques] == [list(tech) for tech in expected]
+
+
+def test_map_markov_sequence_results_are_not_shared():
+    markov_mapper = mapper.UEBAMitreMapper()
+    sequence_data = {"user_id": "u1", "sequence": "auth_login -> upload -> upload -> upload", "score": 0.0}
+    expected = copy.deepcopy(markov_mapper.map_markov_sequence(sequence_data))
+    assert len(expected) == 2
+
+    for tech in markov_mapper.map_markov_sequence(sequence_data):
+        tech["confidence"] = -1.0
+        tech["evidence"]["anomaly_score"] = -1.0
+        tech["evidence"]["tampered"] = True
+
+    assert markov_mapper.map_markov_sequence(sequence_data) == expected
+    assert markov_mapper._map_markov.cache_info().hits == 2
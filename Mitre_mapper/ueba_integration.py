@@ -43,9 +43,9 @@ class UEBAmitreIntegration:
 
         unique_techniques = {}
         for tech in all_techniques:
-            tech_id = tech['id']
-            if tech_id not in unique_techniques or tech['confidence'] > unique_techniques[tech_id]['confidence']:
-                unique_techniques[tech_id] = tech
+            current = unique_techniques.get(tech['id'])
+            if current is None or tech['confidence'] > current['confidence']:
+                unique_techniques[tech['id']] = tech
         
         sorted_techniques = sorted(unique_techniques.values(), 
                                  key=lambda x: x['confidence'], reverse=True)
@@ -67,6 +67,13 @@ class UEBAmitreIntegration:
         """
         Format MITRE techniques into UEBA alerts
         """
+        high_risk_techniques = 0
+        primary_tactics = set()
+        for tech in techniques:
+            if tech.get('confidence', 0) > 0.8:
+                high_risk_techniques += 1
+            primary_tactics.update(tech.get('tactics', ()))
+
         alert = {
             'alert_id': f"ueba_mitre_{__import__('uuid').uuid4().hex[:8]}",
             'timestamp': __import__('datetime').datetime.now().isoformat(),
@@ -75,8 +82,8 @@ class UEBAmitreIntegration:
             'mitre_techniques': techniques,
             'summary': {
                 'total_techniques': len(techniques),
-                'high_risk_techniques': len([t for t in techniques if t.get('confidence', 0) > 0.8]),
-                'primary_tactics': list(set([tactic for tech in techniques for tactic in tech.get('tactics', [])]))
+                'high_risk_techniques': high_risk_techniques,
+                'primary_tactics': list(primary_tactics)
             }
         }
         